@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+"""Batch version of the Image Renamer for large image sets.
+
+Matches each original (reference) image against every image in one or more
+ZIP archives by perceptual hash, then writes the rename mapping CSV and a
+"-renamed.zip" copy of each archive, like the browser tool's downloads.
+
+Images are decoded and hashed in a process pool. Hashes are 256-bit
+blockhashes (16x16 blocks, as blockhash(imageData, 16, 2) in index.html)
+stored as packed uint64 NumPy arrays, and candidates are ranked with a
+vectorized Hamming distance over all archive images at once. Hashes are
+cached on disk keyed by SHA-256 of the file content, so re-runs only decode
+new or changed images.
+
+Requires Pillow and NumPy.
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+# Same extension filters as processArchive() / processOriginals() in index.html
+ARCHIVE_IMAGE_PATTERN = re.compile(r"\.(jpe?g|png|gif|bmp|webp|tiff?)$", re.IGNORECASE)
+ORIGINAL_IMAGE_PATTERN = re.compile(r"\.(jpe?g|png)$", re.IGNORECASE)
+
+# blockhash parameters used by createImageObject(): 256x256 canvas, 16 bits
+HASH_CANVAS = 256
+HASH_BITS = 16
+HASH_WORDS = HASH_BITS * HASH_BITS // 64
+HASH_ALGORITHM = f"blockhash-{HASH_BITS}-canvas{HASH_CANVAS}"
+
+DEFAULT_CACHE = Path(__file__).parent / ".hash_cache.json"
+DEFAULT_TOP_K = 5
+MAPPING_CSV_NAME = "file_renaming_map.csv"
+
+# Memory budget for one vectorized block of (originals x archive images) distances
+MATCH_BLOCK_BYTES = 256 * 1024 * 1024
+
+# Images queued to the pool per worker before waiting for results; bounds the
+# encoded image bytes held in memory
+IN_FLIGHT_PER_WORKER = 8
+
+
+@dataclass
+class ImageEntry:
+    name: str      # file name inside the archive, or original file name
+    source: str    # archive name ("" for loose originals)
+    digest: str    # SHA-256 of the file content
+
+
+def blockhash(data: bytes) -> np.ndarray:
+    """Return the 256-bit blockhash of an encoded image as HASH_WORDS uint64s.
+
+    Mirrors blockhash-core on a 256x256 RGBA canvas: each block's value is the
+    sum of its R+G+B (fully transparent pixels count as white), and a bit is
+    set when the block is brighter than the median of its horizontal band.
+    """
+    with Image.open(BytesIO(data)) as img:
+        img = img.convert("RGBA").resize((HASH_CANVAS, HASH_CANVAS), Image.BILINEAR)
+        pixels = np.asarray(img, dtype=np.uint32)
+
+    values = pixels[:, :, :3].sum(axis=2)
+    values[pixels[:, :, 3] == 0] = 255 * 3
+
+    block = HASH_CANVAS // HASH_BITS
+    blocks = values.reshape(HASH_BITS, block, HASH_BITS, block).sum(axis=(1, 3)).ravel()
+
+    half_block_value = block * block * 256 * 3 / 2
+    bands = blocks.reshape(4, -1).astype(np.float64)
+    medians = np.median(bands, axis=1, keepdims=True)
+    bits = (bands > medians) | ((np.abs(bands - medians) < 1) & (medians > half_block_value))
+
+    return np.packbits(bits.ravel()).view(">u8").astype(np.uint64)
+
+
+def hash_image(data: bytes) -> str | None:
+    """Worker entry point: hash encoded image bytes, returning hex or None on failure."""
+    try:
+        return blockhash(data).astype(">u8").tobytes().hex()
+    except Exception:
+        return None
+
+
+def hex_to_words(hex_hash: str) -> np.ndarray:
+    return np.frombuffer(bytes.fromhex(hex_hash), dtype=">u8").astype(np.uint64)
+
+
+def popcount(words: np.ndarray) -> np.ndarray:
+    """Count set bits per uint64 element."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words)
+    bytes_view = words.view(np.uint8).reshape(*words.shape, 8)
+    return np.unpackbits(bytes_view, axis=-1).sum(axis=-1)
+
+
+def top_k_matches(originals: np.ndarray, candidates: np.ndarray, k: int):
+    """Yield (indices, distances) of the k nearest candidates for each original.
+
+    originals is (n, HASH_WORDS) and candidates (m, HASH_WORDS), both uint64.
+    Distances are Hamming distances in bits (0-256), nearest first.
+    """
+    k = min(k, len(candidates))
+    # Size blocks from the candidate count; the unpackbits popcount fallback
+    # needs 64 bytes per uint64 word compared
+    block_size = max(1, MATCH_BLOCK_BYTES // (len(candidates) * HASH_WORDS * 64))
+    for start in range(0, len(originals), block_size):
+        chunk = originals[start:start + block_size]
+        distances = popcount(chunk[:, None, :] ^ candidates[None, :, :]).sum(axis=2)
+        if k < len(candidates):
+            nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        else:
+            nearest = np.broadcast_to(np.arange(len(candidates)), distances.shape)
+        for row, idx in zip(distances, nearest):
+            order = idx[np.argsort(row[idx], kind="stable")]
+            yield order, row[order]
+
+
+def filename_similarity(name1: str, name2: str) -> float:
+    """Port of filenameSimilarity() in index.html, used to break hash ties."""
+    base1 = re.sub(r"\.[^/.]+$", "", name1).lower()
+    base2 = re.sub(r"\.[^/.]+$", "", name2).lower()
+    if base1 in base2 or base2 in base1:
+        return 0.8
+    return min(len(base1), len(base2)) / max(len(base1), len(base2))
+
+
+def load_cache(path: Path) -> dict[str, str | None]:
+    """Load the content-hash -> image-hash cache, ignoring other algorithms.
+
+    A None value marks content that failed to decode, so it is not retried.
+    """
+    if not path.exists():
+        return {}
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        print(f"WARNING: could not read cache {path}, starting fresh")
+        return {}
+    if data.get("algorithm") != HASH_ALGORITHM:
+        return {}
+    return data.get("hashes", {})
+
+
+def save_cache(path: Path, cache: dict[str, str | None]):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(
+        json.dumps({"algorithm": HASH_ALGORITHM, "hashes": cache}, indent=0),
+        encoding="utf-8",
+    )
+    tmp.replace(path)
+
+
+def collect_archive_images(archive: Path):
+    """Yield (name, bytes) for every image in a ZIP archive."""
+    with zipfile.ZipFile(archive) as zf:
+        for info in zf.infolist():
+            if info.is_dir() or not ARCHIVE_IMAGE_PATTERN.search(info.filename):
+                continue
+            data = zf.read(info)
+            if not data:
+                print(f"  Image {info.filename} is empty (0 bytes), skipping")
+                continue
+            yield info.filename, data
+
+
+def collect_original_images(paths: list[Path]):
+    """Yield (name, bytes) for originals given as image files or ZIP archives."""
+    for path in paths:
+        if path.suffix.lower() == ".zip":
+            with zipfile.ZipFile(path) as zf:
+                for info in zf.infolist():
+                    if not info.is_dir() and ORIGINAL_IMAGE_PATTERN.search(info.filename):
+                        yield info.filename, zf.read(info)
+        elif ORIGINAL_IMAGE_PATTERN.search(path.name):
+            yield path.name, path.read_bytes()
+        else:
+            print(f"  Skipping {path}: not a JPG/PNG image or ZIP archive")
+
+
+class HashQueue:
+    """Submits cache misses to a process pool with a bounded number in flight.
+
+    Results (hex hash, or None for images that failed to decode) are stored
+    in the cache as they complete, so at most max_in_flight encoded images
+    are held in memory at once.
+    """
+
+    def __init__(self, pool: ProcessPoolExecutor, cache: dict[str, str | None],
+                 max_in_flight: int):
+        self.pool = pool
+        self.cache = cache
+        self.max_in_flight = max_in_flight
+        self.pending: deque = deque()
+        self.submitted: set[str] = set()
+        self.failed: set[str] = set()
+        self.cache_hits = 0
+
+    def add(self, items, source: str, entries: list[ImageEntry]):
+        """Register images, hashing those whose content is not cached yet."""
+        for name, data in items:
+            digest = hashlib.sha256(data).hexdigest()
+            entries.append(ImageEntry(name, source, digest))
+            if digest in self.cache:
+                self.cache_hits += 1
+                continue
+            if digest in self.submitted:
+                continue
+            self.submitted.add(digest)
+            self.pending.append((digest, self.pool.submit(hash_image, data)))
+            while len(self.pending) > self.max_in_flight:
+                self._collect_one()
+
+    def drain(self):
+        while self.pending:
+            self._collect_one()
+
+    def _collect_one(self):
+        digest, future = self.pending.popleft()
+        result = future.result()
+        self.cache[digest] = result
+        if result is None:
+            self.failed.add(digest)
+
+
+def write_mapping_csv(path: Path, mapping: list[tuple[ImageEntry, ImageEntry, int]]):
+    """Write the mapping in the same layout as downloadCSV(), plus the distance."""
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+        writer.writerow(["old_filename", "new_filename", "archive_name", "distance"])
+        for original, match, distance in mapping:
+            writer.writerow([match.name, original.name, match.source, distance])
+    print(f"  Written: {path}")
+
+
+def renamed_archive_path(archive: Path, output_dir: Path) -> Path:
+    return output_dir / f"{archive.stem}-renamed.zip"
+
+
+def write_renamed_archive(archive: Path, renames: dict[str, str], output_dir: Path) -> Path:
+    """Copy an archive, renaming matched images and keeping everything else.
+
+    Names are resolved before writing so no two members share a name. Like
+    newZip.file() in index.html, a renamed image replaces a kept member that
+    already has its new name; if two images would be renamed to the same
+    name, the first wins and the other keeps its own name.
+    """
+    out_path = renamed_archive_path(archive, output_dir)
+    with zipfile.ZipFile(archive) as src, zipfile.ZipFile(out_path, "w") as dst:
+        members = [info for info in src.infolist() if not info.is_dir()]
+
+        claimed: dict[str, str] = {}  # new name -> member renamed to it
+        for info in members:
+            target = renames.get(info.filename)
+            if target is None:
+                continue
+            if target in claimed:
+                print(f"WARNING: {archive.name}: {claimed[target]} is already renamed to "
+                      f"{target}, keeping {info.filename} as is")
+                continue
+            claimed[target] = info.filename
+
+        plan = []
+        written = set()
+        for info in members:
+            renamed = renames.get(info.filename)
+            if renamed is not None and claimed.get(renamed) == info.filename:
+                name = renamed
+            else:
+                name = info.filename
+                if claimed.get(name, name) != name:
+                    print(f"WARNING: {archive.name}: dropping {name}, replaced by renamed "
+                          f"{claimed[name]}")
+                    continue
+            if name in written:
+                print(f"WARNING: {archive.name}: duplicate member {name} skipped")
+                continue
+            written.add(name)
+            plan.append((info, name))
+
+        for info, name in plan:
+            new_info = zipfile.ZipInfo(name, info.date_time)
+            new_info.compress_type = info.compress_type
+            new_info.external_attr = info.external_attr
+            with src.open(info) as fin, dst.open(new_info, "w") as fout:
+                shutil.copyfileobj(fin, fout)
+    print(f"  Written: {out_path}")
+    return out_path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Match archive images to originals by perceptual hash and rename them"
+    )
+    parser.add_argument(
+        "--archives", nargs="+", type=Path, required=True,
+        help="ZIP archives containing the images to rename",
+    )
+    parser.add_argument(
+        "--originals", nargs="+", type=Path, required=True,
+        help="Original (reference) images, as JPG/PNG files or ZIP archives",
+    )
+    parser.add_argument(
+        "--output-dir", type=Path, default=Path("."),
+        help="Where to write the mapping CSV and renamed archives (default: .)",
+    )
+    parser.add_argument(
+        "--cache", type=Path, default=DEFAULT_CACHE,
+        help=f"Hash cache file (default: {DEFAULT_CACHE.name} next to this script)",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the cache")
+    parser.add_argument(
+        "--top-k", type=int, default=DEFAULT_TOP_K,
+        help=f"Candidates to report per original (default: {DEFAULT_TOP_K})",
+    )
+    parser.add_argument(
+        "--max-distance", type=int, default=None,
+        help="Leave originals unmatched if the best Hamming distance (0-256) exceeds this",
+    )
+    parser.add_argument(
+        "--candidates-csv", type=Path,
+        help="Also write the top-k candidates per original to this CSV",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=None,
+        help="Worker processes for decoding and hashing (default: CPU count)",
+    )
+    args = parser.parse_args()
+
+    for path in args.archives + args.originals:
+        if not path.is_file():
+            parser.error(f"{path} not found")
+    archive_names = [a.name for a in args.archives]
+    if len(set(archive_names)) != len(archive_names):
+        parser.error("archive file names must be unique")
+    archive_stems = [a.stem for a in args.archives]
+    if len(set(archive_stems)) != len(archive_stems):
+        parser.error("archive names must be unique without their extension")
+
+    # Never let an output overwrite an input while it is still being read
+    inputs = {p.resolve() for p in args.archives + args.originals}
+    outputs = [args.output_dir / MAPPING_CSV_NAME]
+    outputs += [renamed_archive_path(a, args.output_dir) for a in args.archives]
+    if args.candidates_csv:
+        outputs.append(args.candidates_csv)
+    if not args.no_cache:
+        outputs.append(args.cache)
+    for path in outputs:
+        if path.resolve() in inputs:
+            parser.error(f"output {path} would overwrite an input file")
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+
+    cache = {} if args.no_cache else load_cache(args.cache)
+    cached_before = len(cache)
+    known_failures = {digest for digest, value in cache.items() if value is None}
+
+    archive_entries: list[ImageEntry] = []
+    original_entries: list[ImageEntry] = []
+    jobs = args.jobs or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        queue = HashQueue(pool, cache, jobs * IN_FLIGHT_PER_WORKER)
+        for archive in args.archives:
+            print(f"Processing archive: {archive.name}")
+            queue.add(collect_archive_images(archive), archive.name, archive_entries)
+        print("Processing originals")
+        queue.add(collect_original_images(args.originals), "", original_entries)
+        queue.drain()
+    print(f"Hashed {len(queue.submitted)} images ({queue.cache_hits} found in cache)")
+
+    if not args.no_cache and len(cache) != cached_before:
+        save_cache(args.cache, cache)
+
+    skipped_known = 0
+
+    def usable(entries: list[ImageEntry]) -> list[ImageEntry]:
+        nonlocal skipped_known
+        ok = []
+        for entry in entries:
+            if entry.digest in queue.failed:
+                print(f"WARNING: failed to decode {entry.source or 'original'}:{entry.name}")
+            elif entry.digest in known_failures:
+                skipped_known += 1
+            else:
+                ok.append(entry)
+        return ok
+
+    archive_entries = usable(archive_entries)
+    original_entries = usable(original_entries)
+    if skipped_known:
+        print(f"Skipped {skipped_known} images that failed to decode on a previous run")
+    print(f"{len(original_entries)} originals, {len(archive_entries)} archive images")
+    if not archive_entries or not original_entries:
+        sys.exit("ERROR: nothing to match")
+
+    candidate_hashes = np.stack([hex_to_words(cache[e.digest]) for e in archive_entries])
+    original_hashes = np.stack([hex_to_words(cache[e.digest]) for e in original_entries])
+
+    mapping: list[tuple[ImageEntry, ImageEntry, int]] = []
+    candidate_rows = []
+    unmatched = 0
+    for original, (indices, distances) in zip(
+        original_entries, top_k_matches(original_hashes, candidate_hashes, args.top_k)
+    ):
+        ranked = sorted(
+            zip(indices.tolist(), distances.tolist()),
+            key=lambda c: (c[1], -filename_similarity(original.name, archive_entries[c[0]].name)),
+        )
+        for rank, (idx, dist) in enumerate(ranked, 1):
+            match = archive_entries[idx]
+            candidate_rows.append([original.name, rank, match.name, match.source, dist])
+
+        best_idx, best_dist = ranked[0]
+        if args.max_distance is not None and best_dist > args.max_distance:
+            print(f"  No match for {original.name} (best distance {best_dist})")
+            unmatched += 1
+            continue
+        mapping.append((original, archive_entries[best_idx], best_dist))
+
+    write_mapping_csv(args.output_dir / MAPPING_CSV_NAME, mapping)
+    if args.candidates_csv:
+        with open(args.candidates_csv, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+            writer.writerow(["original", "rank", "candidate", "archive_name", "distance"])
+            writer.writerows(candidate_rows)
+        print(f"  Written: {args.candidates_csv}")
+
+    # Like downloadAllZips(): first original matched to an image wins the rename
+    renames: dict[str, dict[str, str]] = {name: {} for name in archive_names}
+    for original, match, _ in mapping:
+        plan = renames[match.source]
+        if match.name in plan:
+            print(f"WARNING: {match.source}:{match.name} already renamed to "
+                  f"{plan[match.name]}, not {original.name}")
+            continue
+        plan[match.name] = original.name
+
+    for archive in args.archives:
+        write_renamed_archive(archive, renames[archive.name], args.output_dir)
+
+    renamed = sum(len(plan) for plan in renames.values())
+    print(f"Final summary: {len(args.archives)} archives processed, {renamed} images renamed, "
+          f"{unmatched} originals unmatched")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""Report request/response latency quantiles from device log files.
+
+Request and response lines are paired by configurable regex patterns, e.g.
+for asp_script_rw_data exchanges or jb_modem commands. Each duration is fed
+into a DDSketch per pair type and per device, so p50/p99/max are reported in
+constant memory no matter how large the logs are. Files are processed in
+parallel, one worker per file, and the per-worker sketches are merged.
+
+Sketches can be saved to JSON with --save and merged with other runs via
+--merge, so results from separate machines or batches combine exactly.
+
+Example:
+  latency_stats.py device1.log device2.log \\
+      --pair rw_data 'asp_script_rw_data.*>> (?P<id>\\w+)' 'asp_script_rw_data.*<< (?P<id>\\w+)'
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import re
+import sys
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from merge_logs import iter_log_records, source_labels
+
+# Relative accuracy of reported quantiles (1% -> p99 within +/-1% of true value)
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+# Bucket cap per sketch; lowest buckets are collapsed beyond this
+DEFAULT_MAX_BINS = 2048
+
+# Open requests remembered per pair before the oldest is dropped
+DEFAULT_MAX_PENDING = 10_000
+
+ALL_DEVICES = "*"
+
+
+class DDSketch:
+    """Mergeable quantile sketch with relative-error guarantees (DDSketch).
+
+    Values fall into logarithmic buckets of ratio gamma, so any quantile is
+    returned within relative_accuracy of the true value. Two sketches built
+    with the same accuracy merge by adding bucket counts.
+    """
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+                 max_bins: int = DEFAULT_MAX_BINS):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float):
+        """Record one non-negative value."""
+        if value < 0:
+            raise ValueError(f"DDSketch values must be non-negative, got {value}")
+        if value == 0:
+            self.zero_count += 1
+        else:
+            key = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[key] = self.bins.get(key, 0) + 1
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "DDSketch"):
+        """Fold another sketch into this one."""
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for key, n in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + n
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def _collapse(self):
+        """Fold the lowest buckets together so at most max_bins remain."""
+        keys = sorted(self.bins)
+        excess = keys[: len(keys) - self.max_bins]
+        target = keys[len(keys) - self.max_bins]
+        for key in excess:
+            self.bins[target] += self.bins.pop(key)
+
+    def quantile(self, q: float) -> float | None:
+        """Return the approximate q-quantile (0 <= q <= 1), or None if empty."""
+        if self.count == 0:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                value = 2 * self.gamma ** key / (self.gamma + 1)
+                # Exact extremes are tracked, so never report beyond them
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        """Serialize to a JSON-compatible dict."""
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "max_bins": self.max_bins,
+            "bins": {str(k): n for k, n in sorted(self.bins.items())},
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DDSketch":
+        """Rebuild a sketch serialized with to_dict()."""
+        sketch = cls(data["relative_accuracy"], data["max_bins"])
+        sketch.bins = {int(k): n for k, n in data["bins"].items()}
+        sketch.zero_count = data["zero_count"]
+        sketch.count = data["count"]
+        sketch.sum = data["sum"]
+        if data["count"]:
+            sketch.min = data["min"]
+            sketch.max = data["max"]
+        return sketch
+
+
+class PairMatcher:
+    """Pairs request and response lines for one exchange type.
+
+    If the patterns capture a named group "id", requests and responses are
+    correlated by it; otherwise each response closes the oldest open request.
+    At most max_pending open requests are tracked in total, oldest dropped
+    first. Responses timestamped before their request (the uptime clock reset
+    in between) are discarded and counted in negative.
+    """
+
+    def __init__(self, name: str, request: str, response: str,
+                 max_pending: int = DEFAULT_MAX_PENDING):
+        self.name = name
+        self.request = re.compile(request)
+        self.response = re.compile(response)
+        self.max_pending = max_pending
+        # Open requests in arrival order: sequence number -> (key, start time)
+        self.open: OrderedDict[int, tuple[str | None, float]] = OrderedDict()
+        # Sequence numbers of open requests per key, oldest first
+        self.pending: dict[str | None, deque[int]] = {}
+        self._next_seq = 0
+        self.dropped = 0
+        self.negative = 0
+
+    @staticmethod
+    def _key(m: re.Match) -> str | None:
+        return m.groupdict().get("id")
+
+    def _pop_oldest(self, key: str | None) -> float:
+        queue = self.pending[key]
+        seq = queue.popleft()
+        if not queue:
+            del self.pending[key]
+        return self.open.pop(seq)[1]
+
+    def feed(self, current_time: float, entry: str) -> float | None:
+        """Process a log line; return a duration in ms when it closes a request."""
+        m = self.response.search(entry)
+        if m:
+            key = self._key(m)
+            if key not in self.pending:
+                return None
+            started = self._pop_oldest(key)
+            if current_time < started:
+                self.negative += 1
+                return None
+            return current_time - started
+
+        m = self.request.search(entry)
+        if m:
+            key = self._key(m)
+            seq = self._next_seq
+            self._next_seq += 1
+            self.open[seq] = (key, current_time)
+            self.pending.setdefault(key, deque()).append(seq)
+            if len(self.open) > self.max_pending:
+                # The globally oldest request is also the oldest for its key
+                oldest_key, _ = next(iter(self.open.values()))
+                self._pop_oldest(oldest_key)
+                self.dropped += 1
+        return None
+
+
+def parse_pair_specs(specs: list[list[str]]) -> list[tuple[str, str, str]]:
+    """Validate --pair NAME REQUEST RESPONSE arguments."""
+    pairs = []
+    for name, request, response in specs:
+        for pattern in (request, response):
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"Invalid pattern for pair '{name}': {pattern!r} ({e})")
+        pairs.append((name, request, response))
+    return pairs
+
+
+def analyze_file(path: Path, device: str, pairs: list[tuple[str, str, str]],
+                 relative_accuracy: float, max_pending: int) -> dict:
+    """Worker entry point: pair one file's lines and return serialized sketches.
+
+    Returns {"sketches": {pair_name: sketch_dict}, "unmatched": int, "dropped": int,
+    "negative": int}.
+    """
+    matchers = [PairMatcher(name, req, resp, max_pending) for name, req, resp in pairs]
+    sketches = {name: DDSketch(relative_accuracy) for name, _, _ in pairs}
+
+    for current_time, _, entry in iter_log_records(path):
+        for matcher in matchers:
+            duration = matcher.feed(current_time, entry)
+            if duration is not None:
+                sketches[matcher.name].add(duration)
+                break
+
+    return {
+        "device": device,
+        "sketches": {name: s.to_dict() for name, s in sketches.items()},
+        "unmatched": sum(len(m.open) for m in matchers),
+        "dropped": sum(m.dropped for m in matchers),
+        "negative": sum(m.negative for m in matchers),
+    }
+
+
+def merge_into(results: dict[tuple[str, str], DDSketch], pair: str, device: str,
+               sketch: DDSketch):
+    """Merge a sketch into results under (pair, device)."""
+    key = (pair, device)
+    if key in results:
+        results[key].merge(sketch)
+    else:
+        results[key] = sketch
+
+
+def load_saved(path: Path, relative_accuracy: float) -> dict[tuple[str, str], DDSketch]:
+    """Load sketches written with --save, checking they can merge with this run."""
+    data = json.loads(path.read_text(encoding="utf-8"))
+    sketches = {}
+    for entry in data["sketches"]:
+        sketch = DDSketch.from_dict(entry["sketch"])
+        if sketch.relative_accuracy != relative_accuracy:
+            raise ValueError(
+                f"{path}: sketches saved with --accuracy {sketch.relative_accuracy}, "
+                f"cannot merge with --accuracy {relative_accuracy}"
+            )
+        sketches[(entry["pair"], entry["device"])] = sketch
+    return sketches
+
+
+def format_ms(value: float | None) -> str:
+    return "" if value is None else f"{value:.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report request/response latency quantiles from device log files"
+    )
+    parser.add_argument("files", nargs="*", type=Path, help="Log files to analyze")
+    parser.add_argument(
+        "--pair",
+        nargs=3,
+        action="append",
+        default=[],
+        metavar=("NAME", "REQUEST", "RESPONSE"),
+        help="Exchange type with request and response regexes; "
+             "a named group (?P<id>...) correlates them (repeatable)",
+    )
+    parser.add_argument(
+        "--merge",
+        type=Path,
+        action="append",
+        default=[],
+        help="Sketch JSON from a previous --save to merge in (repeatable)",
+    )
+    parser.add_argument("--save", type=Path, help="Write merged sketches to JSON")
+    parser.add_argument("-o", "--output", type=Path, help="Output CSV file (default: stdout)")
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=None,
+        help="Worker processes (default: one per file, up to CPU count)",
+    )
+    parser.add_argument(
+        "--accuracy",
+        type=float,
+        default=DEFAULT_RELATIVE_ACCURACY,
+        help=f"Relative accuracy of quantiles (default: {DEFAULT_RELATIVE_ACCURACY})",
+    )
+    parser.add_argument(
+        "--max-pending",
+        type=int,
+        default=DEFAULT_MAX_PENDING,
+        help=f"Open requests tracked per pair before dropping the oldest "
+             f"(default: {DEFAULT_MAX_PENDING})",
+    )
+    args = parser.parse_args()
+
+    if args.files and not args.pair:
+        parser.error("at least one --pair is required to analyze log files")
+    if not args.files and not args.merge:
+        parser.error("nothing to do: give log files and/or --merge sketches")
+    if not 0 < args.accuracy < 1:
+        parser.error("--accuracy must be between 0 and 1")
+    if args.max_pending < 1:
+        parser.error("--max-pending must be at least 1")
+    for path in args.files + args.merge:
+        if not path.is_file():
+            parser.error(f"{path} not found")
+    try:
+        pairs = parse_pair_specs(args.pair)
+    except ValueError as e:
+        parser.error(str(e))
+
+    results: dict[tuple[str, str], DDSketch] = {}
+
+    for path in args.merge:
+        try:
+            saved = load_saved(path, args.accuracy)
+        except ValueError as e:
+            parser.error(str(e))
+        for (pair, device), sketch in saved.items():
+            if device != ALL_DEVICES:
+                merge_into(results, pair, device, sketch)
+        print(f"Merged sketches from {path}", file=sys.stderr)
+
+    if args.files:
+        labels = source_labels(args.files)
+        jobs = args.jobs or min(len(args.files), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [
+                pool.submit(analyze_file, path, label, pairs, args.accuracy, args.max_pending)
+                for path, label in zip(args.files, labels)
+            ]
+            for future in futures:
+                result = future.result()
+                total = 0
+                for pair, data in result["sketches"].items():
+                    sketch = DDSketch.from_dict(data)
+                    total += sketch.count
+                    merge_into(results, pair, result["device"], sketch)
+                print(
+                    f"{result['device']}: {total} pairs, {result['unmatched']} unmatched, "
+                    f"{result['dropped']} dropped requests, "
+                    f"{result['negative']} negative durations skipped",
+                    file=sys.stderr,
+                )
+
+    # Per-type totals across all devices
+    per_device = sorted(results.items())
+    for (pair, _), sketch in per_device:
+        total = results.get((pair, ALL_DEVICES))
+        if total is None:
+            results[(pair, ALL_DEVICES)] = total = DDSketch(sketch.relative_accuracy, sketch.max_bins)
+        total.merge(sketch)
+
+    rows = sorted(results.items(), key=lambda kv: (kv[0][0], kv[0][1] != ALL_DEVICES, kv[0][1]))
+
+    out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    try:
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(["Type", "Device", "Count", "Mean", "P50", "P99", "Max"])
+        for (pair, device), sketch in rows:
+            mean = sketch.sum / sketch.count if sketch.count else None
+            writer.writerow([
+                pair, device, sketch.count, format_ms(mean),
+                format_ms(sketch.quantile(0.5)), format_ms(sketch.quantile(0.99)),
+                format_ms(sketch.max if sketch.count else None),
+            ])
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if args.output:
+        print(f"  Written: {args.output}", file=sys.stderr)
+
+    if args.save:
+        payload = {
+            "sketches": [
+                {"pair": pair, "device": device, "sketch": sketch.to_dict()}
+                for (pair, device), sketch in per_device
+            ]
+        }
+        args.save.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+        print(f"  Written: {args.save}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""Merge log files from several devices into one time-ordered CSV.
+
+Each input file is parsed in its own worker process using the same timestamp
+and log type rules as script.js (parseCustomTimestamp / getLogType). Workers
+write the parsed records to time-sorted spill runs, and the main process only
+streams those runs through a heap-based k-way merge, so memory stays bounded
+by the number of files rather than their size.
+
+A file's own line order is never changed across a device reboot: when the
+uptime clock jumps back by more than --reset-threshold, a new segment starts
+and is emitted after the previous one, with a warning. Smaller backward jumps
+are sorted within their segment.
+
+Output columns:
+  Time, Source, Type, Diff, Source Diff, Type Diff, Log Entry
+"""
+
+import argparse
+import csv
+import heapq
+import math
+import os
+import re
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator
+
+# Same pattern as parseCustomTimestamp() in script.js: "<days>d HH:MM:SS <ms>.<ns>"
+TIMESTAMP_PATTERN = re.compile(r"(\d+)d\s+(\d{2}):(\d{2}):(\d{2})\s+(\d+)\.(\d+)")
+
+# Ordered like getLogType() in script.js: first match wins
+LOG_TYPES = ["asp_script_print", "asp_script_rw_data", "jb_modem"]
+DEFAULT_LOG_TYPE = "default"
+
+# Records held in memory per worker before a sorted run is spilled to disk
+DEFAULT_CHUNK_SIZE = 100_000
+
+# Backward clock jumps larger than this (ms) are treated as a device reboot
+DEFAULT_RESET_THRESHOLD = 60_000
+
+# Clock resets listed per file in the warning before the rest are summarized
+MAX_REPORTED_RESETS = 5
+
+Record = tuple[float, str, str]  # (time_ms, log_type, entry)
+
+
+def parse_custom_timestamp(line: str) -> float | None:
+    """Return the line's timestamp in milliseconds, or None if it has none."""
+    m = TIMESTAMP_PATTERN.search(line)
+    if not m:
+        return None
+    days, hours, minutes, seconds, milliseconds, nanoseconds = map(int, m.groups())
+    return (
+        days * 86400000
+        + hours * 3600000
+        + minutes * 60000
+        + seconds * 1000
+        + milliseconds
+        + nanoseconds / 1000000
+    )
+
+
+def get_log_type(line: str) -> str:
+    """Classify a log line the same way the web viewer does."""
+    for log_type in LOG_TYPES:
+        if log_type in line:
+            return log_type
+    return DEFAULT_LOG_TYPE
+
+
+def js_round(value: float) -> int:
+    """Round half up like JavaScript's Math.round (Python rounds half to even)."""
+    return math.floor(value + 0.5)
+
+
+def iter_log_records(path: Path) -> Iterator[Record]:
+    """Yield (time_ms, log_type, entry) for every timestamped line in a file."""
+    # Split on "\n" only, like content.split('\n') in script.js; a lone "\r"
+    # (e.g. in modem responses) stays part of the line.
+    with open(path, encoding="utf-8", errors="replace", newline="\n") as f:
+        for raw in f:
+            line = raw.rstrip("\r\n")
+            current_time = parse_custom_timestamp(line)
+            if current_time is None:
+                continue
+            yield current_time, get_log_type(line), line
+
+
+def write_records(f, records) -> None:
+    """Write records to an open tab-separated spill file."""
+    # QUOTE_ALL so a "\r" kept inside an entry cannot end the spill row
+    writer = csv.writer(f, delimiter="\t", lineterminator="\n", quoting=csv.QUOTE_ALL)
+    for current_time, log_type, entry in records:
+        writer.writerow((repr(current_time), log_type, entry))
+
+
+def read_records(path: Path) -> Iterator[Record]:
+    """Stream records back from a spill file written by write_records()."""
+    with open(path, encoding="utf-8", newline="") as f:
+        for current_time, log_type, entry in csv.reader(f, delimiter="\t"):
+            yield float(current_time), log_type, entry
+
+
+def iter_segments(records, reset_threshold: float) -> Iterator[tuple[bool, Record]]:
+    """Yield (starts_segment, record), starting a new segment on a clock reset.
+
+    A reset is a jump back of more than reset_threshold ms below the latest
+    time seen in the current segment.
+    """
+    segment_max = None
+    for record in records:
+        current_time = record[0]
+        if segment_max is None or current_time < segment_max - reset_threshold:
+            segment_max = current_time
+            yield True, record
+        else:
+            segment_max = max(segment_max, current_time)
+            yield False, record
+
+
+def spill_file(source: Path, spill_dir: Path, chunk_size: int,
+               reset_threshold: float) -> dict:
+    """Worker entry point: parse one log file into time-sorted spill runs.
+
+    Records are written in runs of chunk_size, each sorted in memory, so
+    worker memory stays bounded. If every segment was already in order the
+    runs are returned as-is, since reading them back in sequence is the file
+    order. Otherwise each segment's runs are merged into one spill, with
+    segments kept in file order. sort() is stable and heapq.merge keeps run
+    order on ties, so equal timestamps stay in their original file order.
+
+    Returns {"count", "resets": [(record_index, from_ms, to_ms)],
+    "in_order": bool, "spills": [paths to read back in sequence]}.
+    """
+    fd, name = tempfile.mkstemp(prefix=f"{source.stem}.", suffix=".tsv", dir=spill_dir)
+    os.close(fd)
+    base = Path(name)
+    segments: list[list[Path]] = []
+    chunk: list[Record] = []
+    run_count = 0
+
+    def flush_run():
+        nonlocal run_count
+        if not chunk:
+            return
+        chunk.sort(key=lambda r: r[0])
+        run_path = base.with_suffix(f".run{run_count}")
+        run_count += 1
+        with open(run_path, "w", encoding="utf-8", newline="") as f:
+            write_records(f, chunk)
+        segments[-1].append(run_path)
+        chunk.clear()
+
+    count = 0
+    resets = []
+    in_order = True
+    previous_time = None
+    for index, (starts_segment, record) in enumerate(
+        iter_segments(iter_log_records(source), reset_threshold)
+    ):
+        count += 1
+        if starts_segment:
+            if segments:
+                flush_run()
+                resets.append((index, previous_time, record[0]))
+            segments.append([])
+        elif record[0] < previous_time:
+            in_order = False
+        previous_time = record[0]
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            flush_run()
+    if segments:
+        flush_run()
+
+    spills: list[Path] = []
+    for runs in segments:
+        if in_order or len(runs) == 1:
+            spills.extend(runs)
+            continue
+        merged_path = base.with_suffix(f".seg{len(spills)}")
+        with open(merged_path, "w", encoding="utf-8", newline="") as out:
+            write_records(out, heapq.merge(*(read_records(p) for p in runs), key=lambda r: r[0]))
+        for run_path in runs:
+            run_path.unlink()
+        spills.append(merged_path)
+    base.unlink()
+
+    return {"count": count, "resets": resets, "in_order": in_order, "spills": spills}
+
+
+def read_spills(paths: list[Path]) -> Iterator[Record]:
+    """Stream records from spill files one after another."""
+    for path in paths:
+        yield from read_records(path)
+
+
+def merge_records(sources: list[tuple[str, Iterator[Record]]]) -> Iterator[tuple[float, str, str, str]]:
+    """K-way merge of record streams into (time_ms, source, log_type, entry).
+
+    Each stream keeps its own order; ties on time are broken by source order,
+    so the output is deterministic.
+    """
+    def tagged(index: int, label: str, records: Iterator[Record]):
+        for current_time, log_type, entry in records:
+            yield current_time, index, label, log_type, entry
+
+    streams = [tagged(i, label, records) for i, (label, records) in enumerate(sources)]
+    for current_time, _, label, log_type, entry in heapq.merge(
+        *streams, key=lambda r: (r[0], r[1])
+    ):
+        yield current_time, label, log_type, entry
+
+
+def iter_with_deltas(merged):
+    """Attach overall, per-source and per-type deltas (in ms) to merged records.
+
+    Deltas mirror diffFromPreviousLog / diffFromPreviousTypeLog in script.js:
+    rounded milliseconds, 0 for the first record of its group.
+    """
+    previous_time = None
+    last_source_times: dict[str, float] = {}
+    last_type_times: dict[str, float] = {}
+
+    for current_time, label, log_type, entry in merged:
+        diff = js_round(current_time - previous_time) if previous_time is not None else 0
+        source_diff = (
+            js_round(current_time - last_source_times[label])
+            if label in last_source_times else 0
+        )
+        type_diff = (
+            js_round(current_time - last_type_times[log_type])
+            if log_type in last_type_times else 0
+        )
+
+        previous_time = current_time
+        last_source_times[label] = current_time
+        last_type_times[log_type] = current_time
+
+        yield current_time, label, log_type, diff, source_diff, type_diff, entry
+
+
+def source_labels(paths: list[Path]) -> list[str]:
+    """Label each input by file name, falling back to the full path on clashes."""
+    names = [p.name for p in paths]
+    return [p.name if names.count(p.name) == 1 else str(p) for p in paths]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Merge log files from several devices into one time-ordered CSV"
+    )
+    parser.add_argument("files", nargs="+", type=Path, help="Log files to merge")
+    parser.add_argument(
+        "-o", "--output",
+        type=Path,
+        help="Output CSV file (default: stdout)",
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=None,
+        help="Worker processes (default: one per file, up to CPU count)",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help=f"Records per sorted run for out-of-order files (default: {DEFAULT_CHUNK_SIZE})",
+    )
+    parser.add_argument(
+        "--reset-threshold",
+        type=float,
+        default=DEFAULT_RESET_THRESHOLD,
+        help=f"Backward clock jump (ms) treated as a device reboot "
+             f"(default: {DEFAULT_RESET_THRESHOLD})",
+    )
+    args = parser.parse_args()
+
+    for path in args.files:
+        if not path.is_file():
+            parser.error(f"{path} not found")
+
+    labels = source_labels(args.files)
+    jobs = args.jobs or min(len(args.files), os.cpu_count() or 1)
+
+    with tempfile.TemporaryDirectory(prefix="merge_logs.") as tmp:
+        spill_dir = Path(tmp)
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [
+                pool.submit(spill_file, path, spill_dir, args.chunk_size, args.reset_threshold)
+                for path in args.files
+            ]
+            scans = [f.result() for f in futures]
+
+        sources = []
+        for label, scan in zip(labels, scans):
+            print(f"Parsed {scan['count']} log lines from {label}", file=sys.stderr)
+            resets = scan["resets"]
+            if resets:
+                print(
+                    f"  WARNING: {label}: clock reset {len(resets)} time(s), "
+                    f"segments kept in file order",
+                    file=sys.stderr,
+                )
+                for index, before, after in resets[:MAX_REPORTED_RESETS]:
+                    print(f"    timestamped line {index + 1}: {before:.3f} ms -> {after:.3f} ms",
+                          file=sys.stderr)
+            if not scan["in_order"]:
+                print(f"  {label}: out-of-order lines sorted within segments", file=sys.stderr)
+            sources.append((label, read_spills(scan["spills"])))
+
+        out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+        try:
+            # Default "\r\n" terminator makes csv quote entries containing "\r"
+            writer = csv.writer(out)
+            writer.writerow(
+                ["Time", "Source", "Type", "Diff", "Source Diff", "Type Diff", "Log Entry"]
+            )
+            total = 0
+            for current_time, label, log_type, diff, source_diff, type_diff, entry in (
+                iter_with_deltas(merge_records(sources))
+            ):
+                writer.writerow(
+                    [f"{current_time:.3f}", label, log_type, diff, source_diff, type_diff, entry]
+                )
+                total += 1
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+    print(f"Merged {total} log lines from {len(sources)} files", file=sys.stderr)
+    if args.output:
+        print(f"  Written: {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""Render a catalog of display texts into screenImage PNGs using US2066 ROM glyphs.
+
+Reads a catalog (JSON object or CSV of id,text) and draws each text with the
+exact 5x8 glyphs from CGRomBitmap.{A,B,C}.cs, mapping characters through
+rom_{A,B,C}_characters.json. Characters missing from the selected ROM use the
+same fallbacks as baltic_char_map.py (ROM letter with the same base, then the
+ASCII base letter), and '?' as a last resort.
+
+Frames are rendered in a process pool and stored once per content hash under
+<output-dir>/frames/, with manifest.json mapping each catalog id to its frame.
+A render cache in the output directory skips strings that have not changed,
+so re-running after a catalog update only renders the new texts. Frames and
+cache entries no longer used by the catalog are removed on each run.
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import struct
+import sys
+import unicodedata
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from baltic_char_map import ROM_IDS, compute_fallbacks, load_rom_reverse_lookup
+from extract_rom_maps import BITMAP_DIR, parse_bitmap_file
+
+GLYPH_WIDTH = 5
+GLYPH_HEIGHT = 8
+
+CACHE_NAME = ".render_cache.json"
+MANIFEST_NAME = "manifest.json"
+FRAMES_DIR = "frames"
+
+UNMAPPED_REPLACEMENT = "?"
+
+
+def load_catalog(path: Path) -> dict[str, str]:
+    """Load {id: text} from a JSON object or an id,text CSV (with header)."""
+    if path.suffix.lower() == ".json":
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if not isinstance(data, dict):
+            raise ValueError(f"{path}: expected a JSON object of id -> text")
+        return {str(k): str(v) for k, v in data.items()}
+
+    catalog: dict[str, str] = {}
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            if not row:
+                continue
+            if len(row) < 2:
+                raise ValueError(f"{path}: expected id,text on line {reader.line_num}")
+            # Allow literal "\n" in CSV cells for multi-line screens
+            catalog[row[0]] = row[1].replace("\\n", "\n")
+    return catalog
+
+
+def load_cache(path: Path) -> dict[str, str]:
+    """Load the render-key -> frame cache, starting fresh if it is unreadable."""
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        print(f"WARNING: could not read cache {path}, starting fresh")
+        return {}
+
+
+def save_cache(path: Path, cache: dict[str, str]):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(cache, indent=0, sort_keys=True), encoding="utf-8")
+    tmp.replace(path)
+
+
+def encode_text(text: str, lookup: dict[str, str], warnings: set[str]) -> list[list[int]]:
+    """Convert text to rows of ROM byte codes, applying fallbacks for missing chars.
+
+    "\r\n", "\n" and a lone "\r" all break lines; other control characters
+    are dropped.
+    """
+    rows = []
+    for line in text.replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+        codes = []
+        for ch in line:
+            if unicodedata.category(ch) == "Cc":
+                warnings.add(f"control character U+{ord(ch):04X} dropped")
+                continue
+            if ch in lookup:
+                codes.append(int(lookup[ch], 16))
+                continue
+            fallback = next((fb for fb in compute_fallbacks(ch, lookup) if fb in lookup), None)
+            if fallback is None:
+                warnings.add(f"'{ch}' (U+{ord(ch):04X}) not in ROM, using '{UNMAPPED_REPLACEMENT}'")
+                fallback = UNMAPPED_REPLACEMENT
+            else:
+                warnings.add(f"'{ch}' (U+{ord(ch):04X}) not in ROM, using '{fallback}'")
+            codes.append(int(lookup[fallback], 16))
+        rows.append(codes)
+    return rows
+
+
+def encode_png(pixels: list[bytearray], width: int, height: int) -> bytes:
+    """Encode 8-bit grayscale rows as a PNG with a fixed, reproducible layout."""
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return (struct.pack(">I", len(data)) + tag + data
+                + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF))
+
+    raw = b"".join(b"\x00" + bytes(row) for row in pixels)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw, 9))
+        + chunk(b"IEND", b"")
+    )
+
+
+# Glyph table and layout, set once per worker by init_worker()
+_glyphs: dict[int, tuple[int, ...]] = {}
+_layout: dict = {}
+
+
+def init_worker(glyphs: dict[int, tuple[int, ...]], layout: dict):
+    global _glyphs, _layout
+    _glyphs = glyphs
+    _layout = layout
+
+
+def render_frame(rows: list[list[int]]) -> bytes:
+    """Worker entry point: rasterize rows of byte codes into PNG bytes."""
+    cols, lines = _layout["cols"], _layout["rows"]
+    scale, char_gap, line_gap = _layout["scale"], _layout["char_gap"], _layout["line_gap"]
+    on, off = _layout["on"], _layout["off"]
+
+    cell_w = GLYPH_WIDTH + char_gap
+    cell_h = GLYPH_HEIGHT + line_gap
+    width = cols * cell_w - char_gap
+    height = lines * cell_h - line_gap
+    dots = [bytearray([off]) * width for _ in range(height)]
+
+    for r, codes in enumerate(rows[:lines]):
+        for c, code in enumerate(codes[:cols]):
+            pattern = _glyphs.get(code)
+            if pattern is None:
+                continue
+            for y, row_val in enumerate(pattern):
+                line = dots[r * cell_h + y]
+                for x in range(GLYPH_WIDTH):
+                    if (row_val >> (GLYPH_WIDTH - 1 - x)) & 1:
+                        line[c * cell_w + x] = on
+
+    pixels = []
+    for line in dots:
+        scaled = bytearray()
+        for value in line:
+            scaled += bytes([value]) * scale
+        pixels.extend(bytearray(scaled) for _ in range(scale))
+    return encode_png(pixels, width * scale, height * scale)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Render display texts into screenImage PNGs using US2066 ROM glyphs"
+    )
+    parser.add_argument("catalog", type=Path, help="Catalog of id -> text (.json or .csv)")
+    parser.add_argument("--rom", choices=ROM_IDS, default="A", help="Character ROM (default: A)")
+    parser.add_argument("--output-dir", type=Path, required=True, help="Output directory")
+    parser.add_argument(
+        "--bitmap-dir",
+        type=Path,
+        default=BITMAP_DIR,
+        help="Directory with CGRomBitmap.{A,B,C}.cs (default: Smdn.Devices.US2066 checkout)",
+    )
+    parser.add_argument("--cols", type=int, default=20, help="Characters per line (default: 20)")
+    parser.add_argument("--rows", type=int, default=4, help="Lines per screen (default: 4)")
+    parser.add_argument("--scale", type=int, default=1, help="Pixels per dot (default: 1)")
+    parser.add_argument("--char-gap", type=int, default=1, help="Dots between characters (default: 1)")
+    parser.add_argument("--line-gap", type=int, default=1, help="Dots between lines (default: 1)")
+    parser.add_argument("--invert", action="store_true", help="Dark glyphs on a light background")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    for name in ("cols", "rows", "scale"):
+        if getattr(args, name) < 1:
+            parser.error(f"--{name} must be a positive integer")
+    for name in ("char_gap", "line_gap"):
+        if getattr(args, name) < 0:
+            parser.error(f"--{name.replace('_', '-')} must not be negative")
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be a positive integer")
+
+    script_dir = Path(__file__).parent
+    bitmap_path = args.bitmap_dir / f"CGRomBitmap.{args.rom}.cs"
+    if not bitmap_path.exists():
+        sys.exit(f"ERROR: {bitmap_path} not found (see --bitmap-dir)")
+    glyphs = parse_bitmap_file(bitmap_path)
+    print(f"Parsed {len(glyphs)} bitmap entries from {bitmap_path.name}")
+
+    lookup = load_rom_reverse_lookup(script_dir / f"rom_{args.rom}_characters.json")
+    print(f"ROM {args.rom}: loaded {len(lookup)} mapped characters")
+    if UNMAPPED_REPLACEMENT not in lookup:
+        sys.exit(f"ERROR: ROM {args.rom} has no '{UNMAPPED_REPLACEMENT}' glyph")
+
+    catalog = load_catalog(args.catalog)
+    print(f"Loaded {len(catalog)} texts from {args.catalog}")
+
+    layout = {
+        "cols": args.cols,
+        "rows": args.rows,
+        "scale": args.scale,
+        "char_gap": args.char_gap,
+        "line_gap": args.line_gap,
+        "on": 0 if args.invert else 255,
+        "off": 255 if args.invert else 0,
+    }
+
+    # Cache keys cover everything that affects the pixels: glyphs, layout, byte codes
+    settings_digest = hashlib.sha256(
+        json.dumps(
+            {"glyphs": sorted(glyphs.items()), "layout": layout}, sort_keys=True
+        ).encode()
+    ).hexdigest()
+
+    output_dir: Path = args.output_dir
+    frames_dir = output_dir / FRAMES_DIR
+    frames_dir.mkdir(parents=True, exist_ok=True)
+
+    cache_path = output_dir / CACHE_NAME
+    cache = load_cache(cache_path)
+
+    warnings: set[str] = set()
+    keys: dict[str, str] = {}
+    to_render: dict[str, list[list[int]]] = {}
+    for text_id, text in catalog.items():
+        rows = encode_text(text, lookup, warnings)
+        if len(rows) > args.rows or any(len(codes) > args.cols for codes in rows):
+            warnings.add(f"{text_id}: text exceeds {args.cols}x{args.rows} and was clipped")
+        key = hashlib.sha256(f"{settings_digest}:{rows}".encode()).hexdigest()
+        keys[text_id] = key
+        frame = cache.get(key)
+        if frame is None or not (frames_dir / f"{frame}.png").exists():
+            to_render.setdefault(key, rows)
+
+    for message in sorted(warnings):
+        print(f"  WARNING: {message}")
+
+    print(f"Rendering {len(to_render)} new frames for {len(catalog)} texts")
+    if to_render:
+        with ProcessPoolExecutor(
+            max_workers=args.jobs, initializer=init_worker, initargs=(glyphs, layout)
+        ) as pool:
+            rendered = pool.map(render_frame, to_render.values(), chunksize=32)
+            for key, png in zip(to_render, rendered):
+                frame = hashlib.sha256(png).hexdigest()[:16]
+                frame_path = frames_dir / f"{frame}.png"
+                if not frame_path.exists():
+                    frame_path.write_bytes(png)
+                cache[key] = frame
+
+    manifest = {
+        text_id: {"text": catalog[text_id], "frame": f"{FRAMES_DIR}/{cache[keys[text_id]]}.png"}
+        for text_id in sorted(catalog)
+    }
+    manifest_path = output_dir / MANIFEST_NAME
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"  Written: {manifest_path}")
+
+    # Keep only what the current catalog uses, so frames/ mirrors the manifest
+    used_keys = set(keys.values())
+    save_cache(cache_path, {key: frame for key, frame in cache.items() if key in used_keys})
+
+    used_frames = {Path(entry["frame"]).name for entry in manifest.values()}
+    removed = 0
+    for frame_path in frames_dir.glob("*.png"):
+        if frame_path.name not in used_frames:
+            frame_path.unlink()
+            removed += 1
+
+    print(f"{len(manifest)} texts -> {len(used_frames)} unique frames in {frames_dir}"
+          f" ({removed} unused removed)")
+
+
+if __name__ == "__main__":
+    main()